@@ -0,0 +1,159 @@
+import numpy as np
+import os
+import json
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+
+def fingerprint_vector(vector):
+    """Отпечаток бинарного вектора"""
+    data = np.ascontiguousarray(np.asarray(vector).flatten(), dtype=np.uint8)
+    return hashlib.sha1(data.tobytes()).hexdigest()
+
+
+def fingerprint_matrix(matrix):
+    """Отпечаток вещественной матрицы (например, ковариационной)"""
+    if matrix is None:
+        return "none"
+    data = np.ascontiguousarray(matrix)
+    digest = hashlib.sha1(f"{data.dtype}{data.shape}".encode())
+    digest.update(data.tobytes())
+    return digest.hexdigest()
+
+
+@contextmanager
+def _file_lock(path, timeout=30.0):
+    """Блокировка файла между процессами и потоками через lock-файл (O_EXCL работает на всех ОС)"""
+    lock_path = path + '.lock'
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            if time.monotonic() < deadline:
+                time.sleep(0.01)
+                continue
+            # Блокировка осталась от аварийно завершённого процесса
+            logger.warning(f"Снятие устаревшей блокировки: {lock_path}")
+            try:
+                os.remove(lock_path)
+            except FileNotFoundError:
+                pass
+            deadline = time.monotonic() + timeout
+    try:
+        yield
+    finally:
+        os.close(fd)
+        os.remove(lock_path)
+
+
+def analysis_key(size, threshold, cov_matrix=None):
+    """Ключ параметров анализа: размер, порог и ковариация ОМНК"""
+    return f"{size[0]}x{size[1]}|{threshold}|{fingerprint_matrix(cov_matrix)}"
+
+
+class PairCache:
+    """Кэш результатов попарного анализа с вытеснением LRU"""
+
+    def __init__(self, path=None, max_entries=100000):
+        self.path = path
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if path and os.path.exists(path):
+            self.load()
+
+    @staticmethod
+    def make_key(params_key, fp1, fp2):
+        return f"{params_key}|{fp1}|{fp2}"
+
+    def get(self, key):
+        """Поиск результата пары (угол, невязка, ошибка); None, если пары нет в кэше"""
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, angle, residual, error=None):
+        """Сохранение результата пары; для пар с ошибкой МНК residual - None"""
+        residual = None if residual is None else float(residual)
+        self.entries[key] = (float(angle), residual, error)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def statistics(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def _read_entries(self):
+        """Записи файла кэша от самой старой к самой свежей"""
+        if not os.path.exists(self.path):
+            return OrderedDict()
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return OrderedDict((key, (angle, residual, error[0] if error else None))
+                           for key, angle, residual, *error in data['entries'][-self.max_entries:])
+
+    def load(self):
+        logger.info(f"Загрузка кэша пар: {self.path}")
+        try:
+            self.entries = self._read_entries()
+            logger.info(f"Кэш загружен. Записей: {len(self.entries)}")
+        except Exception as e:
+            logger.error(f"Ошибка загрузки кэша {self.path}: {e}")
+            self.entries.clear()
+
+    def save(self):
+        """Сохранение с объединением: записи, добавленные в файл другими
+        заданиями после загрузки, не теряются"""
+        if not self.path:
+            return
+        logger.info(f"Сохранение кэша пар: {self.path}")
+        try:
+            with _file_lock(self.path):
+                try:
+                    on_disk = self._read_entries()
+                except Exception as e:
+                    logger.error(f"Ошибка чтения кэша {self.path}: {e}")
+                    on_disk = OrderedDict()
+
+                # Записи из файла старше собственных
+                merged = OrderedDict((key, value) for key, value in on_disk.items()
+                                     if key not in self.entries)
+                merged.update(self.entries)
+                while len(merged) > self.max_entries:
+                    merged.popitem(last=False)
+                    self.evictions += 1
+                self.entries = merged
+
+                data = {'entries': [[key, angle, residual, error]
+                                    for key, (angle, residual, error) in self.entries.items()]}
+                temp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f)
+                os.replace(temp_path, self.path)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения кэша {self.path}: {e}")
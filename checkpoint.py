@@ -0,0 +1,188 @@
+import numpy as np
+import os
+import json
+import shutil
+import logging
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+
+def _row_offset(count, row):
+    """Число пар в строках цикла попарного анализа до строки row"""
+    return row * (2 * count - row - 1) // 2
+
+
+class AnalysisCheckpoint:
+    """Контрольная точка анализа в каталоге path.
+
+    Бинарные матрицы и ковариационная матрица записываются один раз
+    (state.npz). Углы, невязки и признаки дубликатов лежат в заранее
+    выделенных массивах .npy на все пары верхнего треугольника: при
+    сохранении в них дописываются только что завершённые блоки (блок -
+    строки i цикла по парам), а ошибки блока - в отдельный JSON. Последним
+    атомарно записывается meta.json с числом завершённых блоков, поэтому
+    данные незавершённого блока при загрузке игнорируются.
+    """
+
+    ARRAYS = ('angles', 'residuals', 'duplicates')
+
+    def __init__(self, path, params):
+        self.path = path
+        # Параметры сравниваются после сериализации в JSON
+        self.params = json.loads(json.dumps(params))
+        # Число блоков, уже записанных в каталог; None - каталог ещё не подготовлен
+        self.saved_rows = None
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _open_array(self, name, mode, shape=None):
+        dtype = bool if name == 'duplicates' else np.float64
+        return np.lib.format.open_memmap(self._file(f"{name}.npy"), mode=mode, dtype=dtype, shape=shape)
+
+    def load(self):
+        """Загрузка состояния; None, если точки нет или параметры не совпадают"""
+        if not os.path.exists(self._file('meta.json')):
+            return None
+
+        logger.info(f"Загрузка контрольной точки: {self.path}")
+        try:
+            with open(self._file('meta.json'), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta['params'] != self.params:
+                logger.warning("Параметры контрольной точки не совпадают, анализ начнётся заново")
+                return None
+
+            with np.load(self._file('state.npz'), allow_pickle=False) as data:
+                matrices = data['matrices'].astype(int)
+                cov_matrix = data['cov_matrix']
+
+            count = len(matrices)
+            completed_rows = meta['completed_rows']
+            pair_count = _row_offset(count, completed_rows)
+
+            rows, cols = np.triu_indices(count, 1)
+            rows, cols = rows[:pair_count] + 1, cols[:pair_count] + 1
+            if pair_count:
+                angles = np.array(self._open_array('angles', 'r')[:pair_count])
+                residuals = np.array(self._open_array('residuals', 'r')[:pair_count])
+                duplicates = np.array(self._open_array('duplicates', 'r')[:pair_count])
+            else:
+                angles = residuals = np.empty(0)
+                duplicates = np.empty(0, dtype=bool)
+
+            errors = {}
+            for row in meta['error_blocks']:
+                with open(self._file(f"errors_{row}.json"), 'r', encoding='utf-8') as f:
+                    errors.update((int(k), error) for k, error in json.load(f).items())
+
+            pairwise_analysis = [
+                {
+                    'pair_id': f"{i}-{j}",
+                    'image1_idx': int(i),
+                    'image2_idx': int(j),
+                    'vector_angle': None if np.isnan(angle) else float(angle),
+                    'residual': None if np.isnan(residual) else float(residual)
+                }
+                for i, j, angle, residual in zip(rows, cols, angles, residuals)
+            ]
+            for k in np.flatnonzero(duplicates):
+                pairwise_analysis[k]['duplicate'] = True
+            for k, error in errors.items():
+                if k < pair_count:
+                    pairwise_analysis[k]['error'] = error
+
+            self.saved_rows = completed_rows
+            logger.info(f"Контрольная точка загружена. Завершено блоков: {completed_rows}")
+            return {
+                'matrices': matrices,
+                'vectors': matrices.transpose(0, 2, 1).reshape(count, -1),
+                'cov_matrix': cov_matrix,
+                'pairwise_analysis': pairwise_analysis,
+                'completed_rows': completed_rows,
+                'precision': meta['precision'],
+            }
+
+        except Exception as e:
+            logger.error(f"Ошибка загрузки контрольной точки {self.path}: {e}")
+            return None
+
+    def _create(self, matrices, cov_matrix):
+        """Новый каталог точки: матрицы, ковариация и пустые массивы результатов"""
+        self.remove()
+        os.makedirs(self.path)
+
+        np.savez_compressed(self._file('state.npz'),
+                            matrices=np.asarray(matrices, dtype=np.uint8),
+                            cov_matrix=np.asarray(cov_matrix))
+
+        pair_count = _row_offset(len(matrices), len(matrices))
+        if pair_count:
+            for name in self.ARRAYS:
+                array = self._open_array(name, 'w+', shape=(pair_count,))
+                if name != 'duplicates':
+                    array[:] = np.nan
+                array.flush()
+                del array
+        self.saved_rows = 0
+
+    def save(self, matrices, cov_matrix, pairwise_analysis, completed_rows, precision=None):
+        """Сохранение блоков с saved_rows по completed_rows; pairwise_analysis -
+        результаты всех пар, начиная с первой"""
+        logger.info(f"Сохранение контрольной точки: {completed_rows} блоков")
+        try:
+            if self.saved_rows is None:
+                self._create(matrices, cov_matrix)
+
+            count = len(matrices)
+            start = _row_offset(count, self.saved_rows)
+            stop = _row_offset(count, completed_rows)
+            block = pairwise_analysis[start:stop]
+
+            blocks = []
+            if os.path.exists(self._file('meta.json')):
+                with open(self._file('meta.json'), 'r', encoding='utf-8') as f:
+                    blocks = json.load(f)['error_blocks']
+
+            if block:
+                values = {
+                    'angles': [np.nan if pair['vector_angle'] is None else pair['vector_angle']
+                               for pair in block],
+                    'residuals': [np.nan if pair['residual'] is None else pair['residual']
+                                  for pair in block],
+                    'duplicates': [pair.get('duplicate', False) for pair in block],
+                }
+                for name in self.ARRAYS:
+                    array = self._open_array(name, 'r+')
+                    array[start:stop] = values[name]
+                    array.flush()
+                    del array
+
+                errors = {str(start + k): pair['error'] for k, pair in enumerate(block) if 'error' in pair}
+                if errors:
+                    with open(self._file(f"errors_{self.saved_rows}.json"), 'w', encoding='utf-8') as f:
+                        json.dump(errors, f)
+                    blocks.append(self.saved_rows)
+
+            meta = {
+                'params': self.params,
+                'completed_rows': completed_rows,
+                'precision': precision,
+                'error_blocks': blocks,
+            }
+            temp_path = self._file('meta.json.tmp')
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+            os.replace(temp_path, self._file('meta.json'))
+            self.saved_rows = completed_rows
+
+        except Exception as e:
+            logger.error(f"Ошибка сохранения контрольной точки {self.path}: {e}")
+
+    def remove(self):
+        if os.path.isdir(self.path):
+            shutil.rmtree(self.path)
+            logger.info(f"Контрольная точка удалена: {self.path}")
+        elif os.path.exists(self.path):
+            os.remove(self.path)
@@ -3,17 +3,45 @@ import os
 import logging
 from datetime import datetime
 from utils import (
-    load_image_as_matrix_and_vector,
+    load_images_as_matrices_and_vectors,
+    decode_images,
+    preprocess_images,
+    sharpen_images,
+    gram_angles,
     cosine_angle,
     apply_least_squares,
     covariance_matrix,
 )
-from report import create_pdf_report
+from report import create_pdf_report, create_multiresolution_report
+from cache import PairCache, fingerprint_vector, analysis_key
+from checkpoint import AnalysisCheckpoint
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
-def process_images_and_generate_report(img_paths, output_pdf, size, progress_callback=None):
+# Допустимое расхождение углов и невязок с эталоном float64
+PRECISION_TOLERANCE = 1e-3
+
+
+class AnalysisCancelled(BaseException):
+    """Анализ отменён.
+
+    Наследуется от BaseException (как asyncio.CancelledError), чтобы
+    обработчики ошибок отдельных пар не перехватывали отмену.
+    """
+
+
+def _check_cancelled(cancel_event):
+    if cancel_event is not None and cancel_event.is_set():
+        raise AnalysisCancelled("Анализ отменён")
+
+
+def process_images_and_generate_report(img_paths, output_pdf, size, progress_callback=None,
+                                       threshold=0.5, cache_path=None, cache_size=100000,
+                                       deduplicate=True, compute_dtype=np.float64,
+                                       verify_precision=False, checkpoint_path=None,
+                                       checkpoint_every=10, resume=False, grayscale=None,
+                                       report_cache_dir=None, cancel_event=None):
     logger.info("Запуск анализа изображений")
 
     # Структура результатов
@@ -31,36 +59,112 @@ def process_images_and_generate_report(img_paths, output_pdf, size, progress_cal
     }
 
     try:
-        # Загрузка изображений
-        if progress_callback:
-            progress_callback("Начало загрузки изображений...\n")
-
-        vectors = []
-        for idx, path in enumerate(img_paths):
-            matrix, vector = load_image_as_matrix_and_vector(path, size)
-            results['matrices'].append(matrix.tolist())
-            results['vectors'].append(vector.tolist())
-            vectors.append(vector)
+        # Контрольная точка
+        checkpoint = None
+        state = None
+        if checkpoint_path:
+            checkpoint = AnalysisCheckpoint(checkpoint_path, {
+                # Путь, время изменения и размер: изменённые файлы не берутся из точки
+                'images': [[os.path.abspath(path), os.stat(path).st_mtime_ns, os.stat(path).st_size]
+                           for path in img_paths],
+                'size': list(size),
+                'threshold': threshold,
+                'compute_dtype': np.dtype(compute_dtype).name,
+                'deduplicate': deduplicate,
+            })
+            if resume:
+                state = checkpoint.load()
 
+        if state:
+            if progress_callback:
+                progress_callback(f"Возобновление с контрольной точки: завершено блоков "
+                                  f"{state['completed_rows']} из {len(img_paths)}\n")
+            matrices, vectors = state['matrices'], state['vectors']
+        else:
+            # Загрузка изображений
             if progress_callback:
+                progress_callback("Начало загрузки изображений...\n")
+
+            if grayscale is not None:
+                # Изображения уже декодированы (см. process_multiresolution)
+                matrices, vectors = preprocess_images(grayscale, size, threshold)
+            else:
+                matrices, vectors = load_images_as_matrices_and_vectors(img_paths, size, threshold)
+
+        for idx in range(len(img_paths)):
+            results['matrices'].append(matrices[idx].tolist())
+            results['vectors'].append(vectors[idx].tolist())
+
+            if progress_callback and not state:
                 progress_callback(f"Изображение {idx + 1}/{len(img_paths)} загружено\n")
 
         # Вычисление ковариационной матрицы
-        if progress_callback:
-            progress_callback("\nВычисление ковариационной матрицы...\n")
+        _check_cancelled(cancel_event)
+        if state:
+            cov_matrix = state['cov_matrix']
+        else:
+            if progress_callback:
+                progress_callback("\nВычисление ковариационной матрицы...\n")
 
-        cov_matrix = covariance_matrix(vectors)
+            cov_matrix = covariance_matrix(vectors, dtype=compute_dtype)
         results['cov_matrix'] = cov_matrix.tolist()
+        _check_cancelled(cancel_event)
+
+        # Сверка пониженной точности с эталоном float64. Сверяются ковариация и
+        # невязки МНК: углы бинарных векторов всегда считаются точно в int64 и от
+        # compute_dtype не зависят
+        check_precision = verify_precision and np.dtype(compute_dtype) != np.float64
+        if check_precision:
+            cov_reference = covariance_matrix(vectors)
+            precision = (state and state['precision']) or {
+                'compute_dtype': np.dtype(compute_dtype).name,
+                'cov_max_abs_error': float(np.max(np.abs(cov_matrix - cov_reference))),
+                'residual_max_abs_error': 0.0,
+            }
 
         if progress_callback:
             progress_callback(f"Ковариационная матрица ({cov_matrix.shape[0]}x{cov_matrix.shape[1]}) вычислена\n")
 
+        # Дедупликация одинаковых символов: анализируются только уникальные векторы
+        fingerprints = [fingerprint_vector(v) for v in vectors]
+        if deduplicate:
+            unique_ids = {}
+            glyph_ids = [unique_ids.setdefault(fp, len(unique_ids)) for fp in fingerprints]
+            unique_count = len(unique_ids)
+        else:
+            glyph_ids = list(range(len(vectors)))
+            unique_count = len(vectors)
+
+        results['deduplication'] = {
+            'enabled': deduplicate,
+            'unique_count': unique_count,
+            'duplicate_count': len(vectors) - unique_count,
+            'dedup_ratio': len(vectors) / unique_count if unique_count else 1.0,
+        }
+        if progress_callback and deduplicate:
+            progress_callback(f"Уникальных символов: {unique_count} из {len(vectors)} "
+                              f"(коэффициент {results['deduplication']['dedup_ratio']:.2f})\n")
+
+        # Кэш результатов пар
+        cache = PairCache(cache_path, cache_size) if cache_path else None
+        if cache:
+            params_key = analysis_key(size, threshold, cov_matrix)
+        glyph_results = {}
+
         # Попарный анализ
         if progress_callback:
             progress_callback("\nНачало попарного анализа...\n")
 
-        for i in range(len(img_paths)):
+        start_row = 0
+        if state:
+            start_row = state['completed_rows']
+            results['pairwise_analysis'] = state['pairwise_analysis']
+            results['statistics']['angles'] = [pair['vector_angle'] for pair in state['pairwise_analysis']
+                                               if pair['vector_angle'] is not None]
+
+        for i in range(start_row, len(img_paths)):
             for j in range(i + 1, len(img_paths)):
+                _check_cancelled(cancel_event)
                 pair_info = {
                     'pair_id': f"{i + 1}-{j + 1}",
                     'image1_idx': i + 1,
@@ -70,28 +174,73 @@ def process_images_and_generate_report(img_paths, output_pdf, size, progress_cal
                 }
 
                 try:
-                    v1 = np.array(vectors[i])
-                    v2 = np.array(vectors[j])
+                    glyph_pair = (glyph_ids[i], glyph_ids[j])
+                    cached = None
+                    if glyph_pair[0] == glyph_pair[1]:
+                        pair_info['duplicate'] = True
+                    if glyph_pair[0] == glyph_pair[1] and np.any(vectors[i]):
+                        # Одинаковые символы; пустые символы считаются как обычно
+                        # (угол 90°, как в cosine_angle)
+                        cached = (0.0, 0.0, None)
+                    elif glyph_pair in glyph_results:
+                        cached = glyph_results[glyph_pair]
+                    elif cache:
+                        cache_key = cache.make_key(params_key, fingerprints[i], fingerprints[j])
+                        cached = cache.get(cache_key)
+                        if cached is not None:
+                            glyph_results[glyph_pair] = cached
+
+                    if cached is None:
+                        v1 = np.array(vectors[i])
+                        v2 = np.array(vectors[j])
+
+                        # Вычисление угла (точно, в int64)
+                        angle = cosine_angle(v1, v2)
+
+                        residual = None
+                        error = None
+                        try:
+                            # Решение МНК
+                            A = np.column_stack([v1, v2])
+                            x = apply_least_squares(A, v1, cov_matrix=cov_matrix, dtype=compute_dtype)
+
+                            # Вычисление невязки
+                            residual = np.linalg.norm(A @ x - v1)
+                        except Exception as e:
+                            # Угол сохраняется и для пар, где МНК не решается
+                            error = str(e)
 
-                    # Вычисление угла
-                    angle = cosine_angle(v1, v2)
+                        if check_precision and residual is not None:
+                            try:
+                                x_reference = apply_least_squares(A, v1, cov_matrix=cov_reference)
+                                residual_reference = np.linalg.norm(A @ x_reference - v1)
+                                precision['residual_max_abs_error'] = max(
+                                    precision['residual_max_abs_error'],
+                                    float(abs(residual - residual_reference)))
+                            except Exception as e:
+                                logger.warning(f"Эталонный МНК для пары {i + 1}-{j + 1} не решён: {e}")
+
+                        cached = (angle, residual, error)
+                        glyph_results[glyph_pair] = cached
+                        if cache:
+                            cache.put(cache_key, angle, residual, error)
+
+                    angle, residual, error = cached
                     pair_info['vector_angle'] = float(angle)
                     results['statistics']['angles'].append(angle)
 
-                    # Решение МНК
-                    A = np.column_stack([v1, v2])
-                    x = apply_least_squares(A, v1, cov_matrix=cov_matrix)
+                    if error is not None:
+                        logger.error(f"Ошибка анализа пары {i + 1}-{j + 1}: {error}")
+                        pair_info['error'] = error
+                    else:
+                        pair_info['residual'] = float(residual)
 
-                    # Вычисление невязки
-                    residual = np.linalg.norm(A @ x - v1)
-                    pair_info['residual'] = float(residual)
-
-                    if progress_callback:
-                        msg = (f"Пара {i + 1}-{j + 1}:\n"
-                               f"Угол: {angle:.2f}°\n"
-                               f"Невязка: {residual:.4f}\n"
-                               "────────────────────\n")
-                        progress_callback(msg)
+                        if progress_callback:
+                            msg = (f"Пара {i + 1}-{j + 1}:\n"
+                                   f"Угол: {angle:.2f}°\n"
+                                   f"Невязка: {residual:.4f}\n"
+                                   "────────────────────\n")
+                            progress_callback(msg)
 
                 except Exception as e:
                     logger.error(f"Ошибка анализа пары {i + 1}-{j + 1}: {str(e)}")
@@ -99,16 +248,190 @@ def process_images_and_generate_report(img_paths, output_pdf, size, progress_cal
 
                 results['pairwise_analysis'].append(pair_info)
 
+            # checkpoint_every <= 0: только итоговое сохранение после всех пар
+            if checkpoint and checkpoint_every > 0 and (i + 1) % checkpoint_every == 0:
+                checkpoint.save(matrices, cov_matrix, results['pairwise_analysis'], i + 1,
+                                precision if check_precision else None)
+
+        if checkpoint:
+            checkpoint.save(matrices, cov_matrix, results['pairwise_analysis'], len(img_paths),
+                            precision if check_precision else None)
+
+        if check_precision:
+            results['precision'] = precision
+            logger.info(f"Сверка точности {precision['compute_dtype']}: {precision}")
+            if precision['residual_max_abs_error'] > PRECISION_TOLERANCE:
+                logger.warning(f"Расхождение с float64 превышает {PRECISION_TOLERANCE}")
+                if progress_callback:
+                    progress_callback(f"Внимание: расхождение {precision['compute_dtype']} с float64 "
+                                      f"превышает {PRECISION_TOLERANCE}\n")
+
+        if cache:
+            cache.save()
+            results['cache'] = cache.statistics()
+            if progress_callback:
+                progress_callback(f"Кэш пар: попаданий {results['cache']['hits']}, "
+                                  f"промахов {results['cache']['misses']} "
+                                  f"({results['cache']['hit_rate']:.1%})\n")
+
         # Генерация отчёта
+        _check_cancelled(cancel_event)
+        if output_pdf:
+            if progress_callback:
+                progress_callback("\nГенерация отчета...\n")
+
+            create_pdf_report(output_pdf, img_paths, results, size, cache_dir=report_cache_dir)
+            logger.info(f"Отчет сохранен: {output_pdf}")
+
+        # Анализ завершён полностью - контрольная точка больше не нужна
+        if checkpoint:
+            checkpoint.remove()
+        return results
+
+    except Exception as e:
+        logger.critical(f"Критическая ошибка: {str(e)}", exc_info=True)
+        if progress_callback:
+            progress_callback(f"\nОшибка: {str(e)}\n")
+        raise
+
+
+def process_multiresolution(img_paths, output_pdf, sizes, progress_callback=None, **options):
+    """Анализ при нескольких размерах матриц с однократным декодированием изображений.
+
+    Возвращает результаты по каждому размеру и строит общий отчёт со
+    сравнением распределений углов.
+    """
+    logger.info(f"Запуск многомасштабного анализа: {sizes}")
+
+    try:
+        if progress_callback:
+            progress_callback("Декодирование изображений...\n")
+
+        grayscale = decode_images(img_paths)
+
+        results_by_size = []
+        for size in sizes:
+            if progress_callback:
+                progress_callback(f"\n═══ Размер {size[0]}x{size[1]} ═══\n")
+
+            size_options = dict(options)
+            if size_options.get('checkpoint_path'):
+                # Отдельный каталог контрольной точки для каждого размера
+                checkpoint_dir = os.path.normpath(size_options['checkpoint_path'])
+                size_options['checkpoint_path'] = f"{checkpoint_dir}_{size[0]}x{size[1]}"
+
+            results = process_images_and_generate_report(
+                img_paths, None, size,
+                progress_callback=progress_callback,
+                grayscale=grayscale,
+                **size_options
+            )
+            results_by_size.append(results)
+
+        if progress_callback:
+            progress_callback("\nГенерация сводного отчета...\n")
+
+        create_multiresolution_report(output_pdf, img_paths, results_by_size,
+                                      cache_dir=options.get('report_cache_dir'))
+        logger.info(f"Сводный отчет сохранен: {output_pdf}")
+        return results_by_size
+
+    except Exception as e:
+        logger.critical(f"Критическая ошибка: {str(e)}", exc_info=True)
+        if progress_callback:
+            progress_callback(f"\nОшибка: {str(e)}\n")
+        raise
+
+
+def process_threshold_sweep(img_paths, size, thresholds, progress_callback=None):
+    """Перебор порогов бинаризации по одному набору обработанных изображений.
+
+    Изображения декодируются и обрабатываются один раз; для каждого порога
+    углы всех пар считаются через матрицу Грама.
+    """
+    logger.info(f"Запуск перебора порогов: {len(thresholds)} значений")
+
+    try:
         if progress_callback:
-            progress_callback("\nГенерация отчета...\n")
+            progress_callback("Загрузка изображений...\n")
+
+        stack = sharpen_images(decode_images(img_paths), size)
+        data = (stack / 255.0).reshape(len(stack), -1)
+        first, second = np.triu_indices(len(stack), k=1)
+
+        sweep = []
+        blank_masks = []
+        for threshold in thresholds:
+            # Скалярные произведения бинарных векторов - целые числа, float64 считает их точно
+            binary = (data < threshold).astype(np.float64)
+            gram = binary @ binary.T
+            counts = np.diag(gram)
+            angles = gram_angles(gram)[first, second]
+
+            # Одинаковые векторы: расстояние Хэмминга равно нулю. Их угол - шум
+            # округления, поэтому статистика углов считается только по различным парам
+            hamming = counts[first] + counts[second] - 2 * gram[first, second]
+            distinct = hamming > 0
+            blank_masks.append(counts == 0)
+
+            entry = {
+                'threshold': float(threshold),
+                'fill_ratio': float(binary.mean()),
+                'blank_images': int(np.sum(counts == 0)),
+                'identical_pairs': int(np.sum(hamming == 0)),
+                'min_angle': None,
+                'max_angle': None,
+                'mean_angle': None,
+                'std_angle': None,
+            }
+            if np.any(distinct):
+                pair_first, pair_second = first[distinct], second[distinct]
+                distinct_angles = angles[distinct]
+                k_min, k_max = int(np.argmin(distinct_angles)), int(np.argmax(distinct_angles))
+                entry.update({
+                    'min_angle': float(distinct_angles[k_min]),
+                    'min_pair': f"{pair_first[k_min] + 1}-{pair_second[k_min] + 1}",
+                    'max_angle': float(distinct_angles[k_max]),
+                    'max_pair': f"{pair_first[k_max] + 1}-{pair_second[k_max] + 1}",
+                    'mean_angle': float(distinct_angles.mean()),
+                    'std_angle': float(distinct_angles.std()),
+                })
+            sweep.append(entry)
+
+            if progress_callback and entry['min_angle'] is not None:
+                progress_callback(f"Порог {threshold:.3f}: "
+                                  f"мин. угол {entry['min_angle']:.2f}° (пара {entry['min_pair']}), "
+                                  f"средний {entry['mean_angle']:.2f}°, "
+                                  f"одинаковых пар {entry['identical_pairs']}\n")
+
+        results = {
+            'input_parameters': {
+                'image_count': len(img_paths),
+                'image_size': size,
+                'analysis_date': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            },
+            'threshold_sweep': sweep,
+        }
+
+        # Порог с наилучшей разделимостью: меньше всего совпавших пар, затем
+        # наибольший минимальный угол между различными символами. Не
+        # рассматриваются пороги, стирающие символы, непустые при другом пороге;
+        # пустые при всех порогах символы (например, пробел) не мешают выбору
+        always_blank = np.logical_and.reduce(blank_masks) if blank_masks else None
+        candidates = [entry for entry, blank in zip(sweep, blank_masks)
+                      if entry['min_angle'] is not None and not np.any(blank & ~always_blank)]
+        if candidates:
+            best = max(candidates, key=lambda entry: (-entry['identical_pairs'], entry['min_angle']))
+            results['best_threshold'] = best['threshold']
+            if progress_callback:
+                progress_callback(f"\nЛучшая разделимость при пороге {best['threshold']:.3f} "
+                                  f"(мин. угол {best['min_angle']:.2f}°)\n")
 
-        create_pdf_report(output_pdf, img_paths, results, size)
-        logger.info(f"Отчет сохранен: {output_pdf}")
+        logger.info("Перебор порогов завершён")
         return results
 
     except Exception as e:
         logger.critical(f"Критическая ошибка: {str(e)}", exc_info=True)
         if progress_callback:
             progress_callback(f"\nОшибка: {str(e)}\n")
-        raise
\ No newline at end of file
+        raise
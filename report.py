@@ -10,6 +10,8 @@ from PIL import Image
 import matplotlib.pyplot as plt
 import tempfile
 import shutil
+import threading
+import hashlib
 
 # Регистрация кириллического шрифта
 try:
@@ -25,11 +27,105 @@ except:
 # Настройка Matplotlib для работы без дисплея
 plt.switch_backend('Agg')
 
+# pyplot хранит глобальное состояние: отчёты из разных потоков строят графики по очереди
+_pyplot_lock = threading.Lock()
+
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
+# Версия оформления разделов: при изменении отрисовки старые файлы кэша не используются
+_SECTION_CACHE_VERSION = 1
+
+# Предельный размер кэша разделов; сверх него удаляются давно не использованные файлы
+SECTION_CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+
+def _section_file(section, inputs, ext, cache_dir, temp_dir, temp_name=None):
+    """Файл раздела отчёта (график, миниатюра) и признак его наличия в кэше.
+
+    Без cache_dir файл создаётся во временном каталоге отчёта. С cache_dir
+    имя файла - хэш входных данных раздела, и готовый файл используется повторно.
+    """
+    if not cache_dir:
+        return os.path.join(temp_dir, (temp_name or section) + ext), False
+
+    digest = hashlib.sha1(f"{section}|{_SECTION_CACHE_VERSION}".encode())
+    for item in inputs:
+        if isinstance(item, np.ndarray):
+            digest.update(f"{item.dtype}{item.shape}".encode())
+            digest.update(np.ascontiguousarray(item).tobytes())
+        else:
+            digest.update(repr(item).encode())
+
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"{section}_{digest.hexdigest()}{ext}")
+    cached = os.path.exists(path)
+    if cached:
+        # Время изменения отмечает последнее использование (для вытеснения LRU)
+        os.utime(path)
+        logger.debug(f"Раздел {section} взят из кэша: {path}")
+    return path, cached
+
+
+def _prune_section_cache(cache_dir, max_bytes=SECTION_CACHE_MAX_BYTES):
+    """Удаление давно не использованных файлов кэша разделов сверх max_bytes"""
+    try:
+        files = []
+        for name in os.listdir(cache_dir):
+            path = os.path.join(cache_dir, name)
+            if name.endswith('.part') or not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            removed += 1
+
+        if removed:
+            logger.info(f"Кэш разделов: удалено файлов {removed}, размер {total} байт")
+    except Exception as e:
+        logger.error(f"Ошибка очистки кэша разделов {cache_dir}: {e}")
 
-def create_pdf_report(output_path, img_paths, results, size):
+
+def _write_section(path, write):
+    """Атомарная запись файла раздела: write(путь) пишет во временный файл"""
+    temp_path = f"{path}.{threading.get_ident()}.part"
+    write(temp_path)
+    os.replace(temp_path, path)
+
+
+def _save_array(path, array):
+    with open(path, 'wb') as f:
+        np.save(f, array)
+
+
+def _thumbnail_file(path, thumb_size, temp_dir, cache_dir, temp_name):
+    """Миниатюра изображения в формате PNG"""
+    stat = os.stat(path)
+    thumb_file, cached = _section_file("thumbnail",
+                                       (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, int(thumb_size)),
+                                       ".png", cache_dir, temp_dir, temp_name)
+    if not cached:
+        with Image.open(path) as img:
+            # Конвертируем в RGB, если нужно
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+
+            # Создаем миниатюру с сохранением пропорций
+            img.thumbnail((int(thumb_size), int(thumb_size)))
+            _write_section(thumb_file, lambda target: img.save(target, format='PNG'))
+    return thumb_file
+
+
+def create_pdf_report(output_path, img_paths, results, size, cache_dir=None,
+                      cache_max_bytes=SECTION_CACHE_MAX_BYTES):
+    """PDF-отчёт; с cache_dir графики и миниатюры берутся из кэша, если их данные не изменились"""
     temp_dir = tempfile.mkdtemp()
     try:
         logger.info(f"Создание отчёта: {output_path}")
@@ -45,7 +141,7 @@ def create_pdf_report(output_path, img_paths, results, size):
 
         # Страница с миниатюрами изображений
         pdf.showPage()
-        _add_thumbnails_page(pdf, img_paths, width, height, margin, temp_dir)
+        _add_thumbnails_page(pdf, img_paths, width, height, margin, temp_dir, cache_dir)
 
         # Страница с матрицами
         pdf.showPage()
@@ -53,7 +149,7 @@ def create_pdf_report(output_path, img_paths, results, size):
 
         # Страница с графиком собственных значений
         pdf.showPage()
-        _add_eigenvalues_page(pdf, results, width, height, margin, temp_dir)
+        _add_eigenvalues_page(pdf, results, width, height, margin, temp_dir, cache_dir)
 
         # Страница с углами
         pdf.showPage()
@@ -61,10 +157,12 @@ def create_pdf_report(output_path, img_paths, results, size):
 
         # Страница с графиком углов и миниатюрами
         pdf.showPage()
-        _add_angles_plot_page(pdf, results, width, height, margin, temp_dir, img_paths)
+        _add_angles_plot_page(pdf, results, width, height, margin, temp_dir, img_paths, cache_dir)
 
         pdf.save()
         logger.info(f"Отчёт создан: {output_path}")
+        if cache_dir:
+            _prune_section_cache(cache_dir, cache_max_bytes)
     except Exception as e:
         logger.critical(f"Ошибка создания отчёта: {str(e)}", exc_info=True)
         if os.path.exists(output_path):
@@ -74,6 +172,42 @@ def create_pdf_report(output_path, img_paths, results, size):
         shutil.rmtree(temp_dir, ignore_errors=True)
 
 
+def create_multiresolution_report(output_path, img_paths, results_by_size, cache_dir=None,
+                                  cache_max_bytes=SECTION_CACHE_MAX_BYTES):
+    """Сводный отчёт по анализу при нескольких размерах матриц"""
+    temp_dir = tempfile.mkdtemp()
+    try:
+        logger.info(f"Создание сводного отчёта: {output_path}")
+        pdf = canvas.Canvas(output_path, pagesize=A4)
+        width, height = A4
+        margin = 1.5 * cm
+
+        pdf.setFont("Arial", 12)
+
+        # Титульная страница
+        _add_multiresolution_title_page(pdf, width, height, margin, results_by_size)
+
+        # Страница с миниатюрами изображений
+        pdf.showPage()
+        _add_thumbnails_page(pdf, img_paths, width, height, margin, temp_dir, cache_dir)
+
+        # Сравнение распределений углов
+        pdf.showPage()
+        _add_resolution_comparison_page(pdf, results_by_size, width, height, margin, temp_dir, cache_dir)
+
+        pdf.save()
+        logger.info(f"Сводный отчёт создан: {output_path}")
+        if cache_dir:
+            _prune_section_cache(cache_dir, cache_max_bytes)
+    except Exception as e:
+        logger.critical(f"Ошибка создания сводного отчёта: {str(e)}", exc_info=True)
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
 def _add_title_page(pdf, width, height, margin, results):
     """Титульная страница"""
     # Используем кириллический шрифт
@@ -107,7 +241,7 @@ def _add_title_page(pdf, width, height, margin, results):
     pdf.drawString(margin + 0.5 * cm, y, "• Решение систем уравнений методом наименьших квадратов")
 
 
-def _add_thumbnails_page(pdf, img_paths, width, height, margin, temp_dir):
+def _add_thumbnails_page(pdf, img_paths, width, height, margin, temp_dir, cache_dir=None):
     """Страница с миниатюрами изображений"""
     pdf.setFont("Arial-Bold", 16)
     pdf.drawCentredString(width / 2, height - margin, "ИСХОДНЫЕ ИЗОБРАЖЕНИЯ")
@@ -141,18 +275,8 @@ def _add_thumbnails_page(pdf, img_paths, width, height, margin, temp_dir):
             x = start_x + (i % images_per_row) * (thumb_size + spacing)
 
         try:
-            # Создаем временный файл для изображения
-            temp_file = os.path.join(temp_dir, f"thumb_{i}.png")
-
-            # Загрузка и обработка изображения
-            with Image.open(path) as img:
-                # Конвертируем в RGB, если нужно
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-
-                # Создаем миниатюру с сохранением пропорций
-                img.thumbnail((int(thumb_size), int(thumb_size)))
-                img.save(temp_file, format='PNG')
+            # Миниатюра изображения
+            temp_file = _thumbnail_file(path, thumb_size, temp_dir, cache_dir, f"thumb_{i}")
 
             # Добавляем в PDF
             pdf.drawImage(temp_file, x, y - thumb_size,
@@ -210,7 +334,7 @@ def _add_matrices_page(pdf, results, width, height, margin):
         row_count += 1
 
 
-def _add_eigenvalues_page(pdf, results, width, height, margin, temp_dir):
+def _add_eigenvalues_page(pdf, results, width, height, margin, temp_dir, cache_dir=None):
     """Страница с графиком собственных значений"""
     pdf.setFont("Arial-Bold", 16)
     pdf.drawCentredString(width / 2, height - margin, "СОБСТВЕННЫЕ ЗНАЧЕНИЯ КОВАРИАЦИОННОЙ МАТРИЦЫ")
@@ -225,23 +349,31 @@ def _add_eigenvalues_page(pdf, results, width, height, margin, temp_dir):
         cov_matrix = np.array(results['cov_matrix'])
 
         # Вычисляем собственные значения
-        eigenvalues = np.linalg.eigvalsh(cov_matrix)
-        # Сортируем по убыванию
-        eigenvalues = np.sort(eigenvalues)[::-1]
+        eigen_file, cached = _section_file("eigenvalues", (cov_matrix,), ".npy", cache_dir, temp_dir)
+        if cached:
+            eigenvalues = np.load(eigen_file)
+        else:
+            eigenvalues = np.linalg.eigvalsh(cov_matrix)
+            # Сортируем по убыванию
+            eigenvalues = np.sort(eigenvalues)[::-1]
+            _write_section(eigen_file, lambda target: _save_array(target, eigenvalues))
 
         # Создаем график
-        plt.figure(figsize=(10, 6))
-        plt.plot(eigenvalues, 'bo-')
-        plt.title("Собственные значения ковариационной матрицы")
-        plt.xlabel("Номер компоненты")
-        plt.ylabel("Собственное значение")
-        plt.grid(True)
-        plt.yscale('log')  # Логарифмическая шкала для лучшей визуализации
-
-        # Сохраняем во временный файл
-        temp_file = os.path.join(temp_dir, "eigenvalues.png")
-        plt.savefig(temp_file, format='png', dpi=150, bbox_inches='tight')
-        plt.close()
+        temp_file, cached = _section_file("eigenvalues_plot", (cov_matrix,), ".png", cache_dir, temp_dir)
+        if not cached:
+            with _pyplot_lock:
+                plt.figure(figsize=(10, 6))
+                plt.plot(eigenvalues, 'bo-')
+                plt.title("Собственные значения ковариационной матрицы")
+                plt.xlabel("Номер компоненты")
+                plt.ylabel("Собственное значение")
+                plt.grid(True)
+                plt.yscale('log')  # Логарифмическая шкала для лучшей визуализации
+
+                # Сохраняем в файл раздела
+                _write_section(temp_file, lambda target: plt.savefig(target, format='png', dpi=150,
+                                                                     bbox_inches='tight'))
+                plt.close()
 
         # Размещаем график
         pdf.drawImage(temp_file, margin, height / 3,
@@ -315,7 +447,7 @@ def _add_angles_page(pdf, results, width, height, margin):
         y -= line_height
 
 
-def _add_angles_plot_page(pdf, results, width, height, margin, temp_dir, img_paths):
+def _add_angles_plot_page(pdf, results, width, height, margin, temp_dir, img_paths, cache_dir=None):
     """Страница с графиком распределения углов и миниатюрами для min/max углов"""
     pdf.setFont("Arial-Bold", 16)
     pdf.drawCentredString(width / 2, height - margin, "РАСПРЕДЕЛЕНИЕ УГЛОВ МЕЖДУ ВЕКТОРАМИ")
@@ -348,25 +480,30 @@ def _add_angles_plot_page(pdf, results, width, height, margin, temp_dir, img_pat
                     max_angle = angle
                     max_pair = pair
 
-        # Создаем гистограмму
-        plt.figure(figsize=(10, 6))
-        n, bins, patches = plt.hist(angles, bins=15, color='skyblue', edgecolor='black')
-
-        # Добавляем линию среднего значения
         mean_angle = np.mean(angles)
-        plt.axvline(mean_angle, color='red', linestyle='dashed', linewidth=1)
-        plt.text(mean_angle + 1, max(n) * 0.9, f'Среднее: {mean_angle:.1f}°', color='red')
 
-        # Настройки оформления
-        plt.title("Распределение углов между векторами изображений")
-        plt.xlabel("Угол между векторами (°)")
-        plt.ylabel("Количество пар")
-        plt.grid(axis='y', alpha=0.75)
-
-        # Сохраняем во временный файл
-        temp_file = os.path.join(temp_dir, "angles_hist.png")
-        plt.savefig(temp_file, format='png', dpi=150, bbox_inches='tight')
-        plt.close()
+        # Создаем гистограмму
+        temp_file, cached = _section_file("angles_hist", (np.array(angles, dtype=float),), ".png",
+                                          cache_dir, temp_dir)
+        if not cached:
+            with _pyplot_lock:
+                plt.figure(figsize=(10, 6))
+                n, bins, patches = plt.hist(angles, bins=15, color='skyblue', edgecolor='black')
+
+                # Добавляем линию среднего значения
+                plt.axvline(mean_angle, color='red', linestyle='dashed', linewidth=1)
+                plt.text(mean_angle + 1, max(n) * 0.9, f'Среднее: {mean_angle:.1f}°', color='red')
+
+                # Настройки оформления
+                plt.title("Распределение углов между векторами изображений")
+                plt.xlabel("Угол между векторами (°)")
+                plt.ylabel("Количество пар")
+                plt.grid(axis='y', alpha=0.75)
+
+                # Сохраняем в файл раздела
+                _write_section(temp_file, lambda target: plt.savefig(target, format='png', dpi=150,
+                                                                     bbox_inches='tight'))
+                plt.close()
 
         # Размещаем график (уменьшаем высоту, чтобы освободить место для миниатюр)
         plot_height = height * 0.4
@@ -395,12 +532,8 @@ def _add_angles_plot_page(pdf, results, width, height, margin, temp_dir, img_pat
             # Первое изображение
             try:
                 if 0 <= img1_idx < len(img_paths):
-                    temp_file1 = os.path.join(temp_dir, f"min_thumb1.png")
-                    with Image.open(img_paths[img1_idx]) as img:
-                        if img.mode != 'RGB':
-                            img = img.convert('RGB')
-                        img.thumbnail((int(thumb_size), int(thumb_size)))
-                        img.save(temp_file1, 'PNG')
+                    temp_file1 = _thumbnail_file(img_paths[img1_idx], thumb_size, temp_dir, cache_dir,
+                                                  "min_thumb1")
                     pdf.drawImage(temp_file1, margin, y_pos - 1.5 * cm - thumb_size - 0.2 * cm,
                                   width=thumb_size, height=thumb_size)
                     pdf.drawCentredString(margin + thumb_size / 2, y_pos - 1.5 * cm - thumb_size - 0.5 * cm,
@@ -411,12 +544,8 @@ def _add_angles_plot_page(pdf, results, width, height, margin, temp_dir, img_pat
             # Второе изображение
             try:
                 if 0 <= img2_idx < len(img_paths):
-                    temp_file2 = os.path.join(temp_dir, f"min_thumb2.png")
-                    with Image.open(img_paths[img2_idx]) as img:
-                        if img.mode != 'RGB':
-                            img = img.convert('RGB')
-                        img.thumbnail((int(thumb_size), int(thumb_size)))
-                        img.save(temp_file2, 'PNG')
+                    temp_file2 = _thumbnail_file(img_paths[img2_idx], thumb_size, temp_dir, cache_dir,
+                                                  "min_thumb2")
                     pdf.drawImage(temp_file2, margin + thumb_size + 1 * cm, y_pos - 1.5 * cm - thumb_size - 0.2 * cm,
                                   width=thumb_size, height=thumb_size)
                     pdf.drawCentredString(margin + thumb_size + 1 * cm + thumb_size / 2,
@@ -439,12 +568,8 @@ def _add_angles_plot_page(pdf, results, width, height, margin, temp_dir, img_pat
             # Первое изображение
             try:
                 if 0 <= img1_idx < len(img_paths):
-                    temp_file1 = os.path.join(temp_dir, f"max_thumb1.png")
-                    with Image.open(img_paths[img1_idx]) as img:
-                        if img.mode != 'RGB':
-                            img = img.convert('RGB')
-                        img.thumbnail((int(thumb_size), int(thumb_size)))
-                        img.save(temp_file1, 'PNG')
+                    temp_file1 = _thumbnail_file(img_paths[img1_idx], thumb_size, temp_dir, cache_dir,
+                                                  "max_thumb1")
                     pdf.drawImage(temp_file1, margin, y_pos_min - thumb_size - 0.2 * cm,
                                   width=thumb_size, height=thumb_size)
                     pdf.drawCentredString(margin + thumb_size / 2, y_pos_min - thumb_size - 0.5 * cm,
@@ -455,12 +580,8 @@ def _add_angles_plot_page(pdf, results, width, height, margin, temp_dir, img_pat
             # Второе изображение
             try:
                 if 0 <= img2_idx < len(img_paths):
-                    temp_file2 = os.path.join(temp_dir, f"max_thumb2.png")
-                    with Image.open(img_paths[img2_idx]) as img:
-                        if img.mode != 'RGB':
-                            img = img.convert('RGB')
-                        img.thumbnail((int(thumb_size), int(thumb_size)))
-                        img.save(temp_file2, 'PNG')
+                    temp_file2 = _thumbnail_file(img_paths[img2_idx], thumb_size, temp_dir, cache_dir,
+                                                  "max_thumb2")
                     pdf.drawImage(temp_file2, margin + thumb_size + 1 * cm, y_pos_min - thumb_size - 0.2 * cm,
                                   width=thumb_size, height=thumb_size)
                     pdf.drawCentredString(margin + thumb_size + 1 * cm + thumb_size / 2,
@@ -472,4 +593,89 @@ def _add_angles_plot_page(pdf, results, width, height, margin, temp_dir, img_pat
     except Exception as e:
         logger.error(f"Ошибка создания графика углов: {str(e)}")
         pdf.setFont("Arial", 10)
-        pdf.drawString(margin, height - margin - 1 * cm, f"Ошибка создания графика: {str(e)}")
\ No newline at end of file
+        pdf.drawString(margin, height - margin - 1 * cm, f"Ошибка создания графика: {str(e)}")
+
+
+def _add_multiresolution_title_page(pdf, width, height, margin, results_by_size):
+    """Титульная страница сводного отчёта"""
+    pdf.setFont("Arial-Bold", 18)
+    pdf.drawCentredString(width / 2, height - margin, "СРАВНЕНИЕ РАЗМЕРОВ МАТРИЦ")
+
+    pdf.setFont("Arial", 12)
+    y = height - margin - 2 * cm
+    params = results_by_size[0]['input_parameters'] if results_by_size else {}
+    sizes = ", ".join(f"{r['input_parameters']['image_size'][0]}x{r['input_parameters']['image_size'][1]}"
+                      for r in results_by_size)
+
+    pdf.drawCentredString(width / 2, y, f"Дата анализа: {params.get('analysis_date', 'N/A')}")
+    y -= 1 * cm
+    pdf.drawCentredString(width / 2, y, f"Количество изображений: {params.get('image_count', 'N/A')}")
+    y -= 1 * cm
+    pdf.drawCentredString(width / 2, y, f"Размеры матриц: {sizes}")
+
+    pdf.line(margin, y - 1 * cm, width - margin, y - 1 * cm)
+
+
+def _add_resolution_comparison_page(pdf, results_by_size, width, height, margin, temp_dir, cache_dir=None):
+    """Страница со сравнением распределений углов при разных размерах матриц"""
+    pdf.setFont("Arial-Bold", 16)
+    pdf.drawCentredString(width / 2, height - margin, "РАСПРЕДЕЛЕНИЕ УГЛОВ ПО РАЗМЕРАМ")
+
+    series = []
+    for results in results_by_size:
+        size = results['input_parameters']['image_size']
+        angles = results['statistics']['angles']
+        if angles:
+            series.append((f"{size[0]}x{size[1]}", np.array(angles, dtype=float)))
+
+    if not series:
+        pdf.setFont("Arial", 10)
+        pdf.drawString(margin, height - margin - 1 * cm, "Нет данных об углах")
+        return
+
+    try:
+        # Общие интервалы для всех размеров
+        bins = np.linspace(0, 90, 19)
+        temp_file, cached = _section_file("angles_by_size", [item for entry in series for item in entry],
+                                          ".png", cache_dir, temp_dir)
+        if not cached:
+            with _pyplot_lock:
+                plt.figure(figsize=(10, 6))
+                for label, angles in series:
+                    plt.hist(angles, bins=bins, histtype='step', linewidth=2, label=label)
+                plt.title("Распределение углов между векторами при разных размерах")
+                plt.xlabel("Угол между векторами (°)")
+                plt.ylabel("Количество пар")
+                plt.legend(title="Размер")
+                plt.grid(axis='y', alpha=0.75)
+
+                _write_section(temp_file, lambda target: plt.savefig(target, format='png', dpi=150,
+                                                                     bbox_inches='tight'))
+                plt.close()
+
+        plot_height = height * 0.4
+        pdf.drawImage(temp_file, margin, height - margin - plot_height - 1 * cm,
+                      width=width - 2 * margin, height=plot_height,
+                      preserveAspectRatio=True, anchor='c')
+
+        # Таблица статистики
+        y = height - margin - plot_height - 2 * cm
+        columns = [margin, margin + 3 * cm, margin + 6 * cm, margin + 9 * cm, margin + 12 * cm]
+        pdf.setFont("Arial-Bold", 10)
+        for x, title in zip(columns, ["Размер", "Мин. угол", "Макс. угол", "Средний", "Ст. откл."]):
+            pdf.drawString(x, y, title)
+        pdf.line(margin, y - 0.2 * cm, width - margin, y - 0.2 * cm)
+        y -= 0.7 * cm
+
+        pdf.setFont("Arial", 10)
+        for label, angles in series:
+            values = [label, f"{angles.min():.2f}°", f"{angles.max():.2f}°",
+                      f"{angles.mean():.2f}°", f"{angles.std():.2f}°"]
+            for x, value in zip(columns, values):
+                pdf.drawString(x, y, value)
+            y -= 0.6 * cm
+
+    except Exception as e:
+        logger.error(f"Ошибка создания сравнения размеров: {str(e)}")
+        pdf.setFont("Arial", 10)
+        pdf.drawString(margin, height - margin - 1 * cm, f"Ошибка создания графика: {str(e)}")
@@ -0,0 +1,209 @@
+import asyncio
+import functools
+import itertools
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from main_logic import process_images_and_generate_report, AnalysisCancelled
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Задания выполняются в потоках. Основное время анализа - цикл по парам на
+# Python, удерживающий GIL, поэтому потоки выполняются параллельно лишь на
+# участках, где numpy и PIL отпускают GIL (декодирование, ресемплинг, матричные
+# операции), а остальное время делят одно ядро. Больше нескольких одновременных
+# заданий не ускоряет обработку, а лишь растягивает каждое задание и умножает
+# расход памяти, поэтому по умолчанию их не больше четверти ядер. При крупных
+# размерах (32x32 - ковариация 1024x1024) каждое задание дополнительно занимает
+# потоки BLAS; их число ограничивается OMP_NUM_THREADS/OPENBLAS_NUM_THREADS.
+DEFAULT_MAX_CONCURRENCY = max(1, (os.cpu_count() or 1) // 4)
+
+# Сколько непрочитанных сообщений о прогрессе хранит задание; старые вытесняются
+DEFAULT_MAX_MESSAGES = 1000
+
+
+async def analyze_images(img_paths, output_pdf, size, progress_callback=None,
+                         executor=None, cancel_event=None, **options):
+    """Асинхронный запуск анализа: вычисления выполняются в executor.
+
+    progress_callback вызывается в потоке цикла событий. Если задан
+    cancel_event (threading.Event), анализ прерывается на ближайшей
+    проверке после его установки: между стадиями и перед каждой парой.
+    """
+    loop = asyncio.get_running_loop()
+    cancel_event = cancel_event or threading.Event()
+
+    def callback(message):
+        if cancel_event.is_set():
+            raise AnalysisCancelled("Анализ отменён")
+        if progress_callback:
+            loop.call_soon_threadsafe(progress_callback, message)
+
+    call = functools.partial(process_images_and_generate_report, img_paths, output_pdf, size,
+                             progress_callback=callback, cancel_event=cancel_event, **options)
+    try:
+        return await loop.run_in_executor(executor, call)
+    except asyncio.CancelledError:
+        # Останавливаем поток вычислений вместе с задачей
+        cancel_event.set()
+        raise
+
+
+class AnalysisJob:
+    """Задание на анализ в очереди сервиса"""
+
+    def __init__(self, job_id, img_paths, output_pdf, size, options, max_messages=DEFAULT_MAX_MESSAGES):
+        self.job_id = job_id
+        self.img_paths = list(img_paths)
+        self.output_pdf = output_pdf
+        self.size = size
+        self.options = options
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.dropped_messages = 0
+
+        self._cancel_event = threading.Event()
+        self._messages = asyncio.Queue(maxsize=max_messages)
+        self._done = asyncio.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def cancel(self):
+        """Отмена задания: задание из очереди завершается сразу, выполняемое -
+        на ближайшей проверке отмены"""
+        if not self.done:
+            logger.info(f"Отмена задания {self.job_id}")
+            self._cancel_event.set()
+            if self.status == 'queued':
+                self._finish('cancelled')
+
+    def _post(self, message):
+        """Добавление сообщения; при переполнении вытесняется самое старое"""
+        if self._messages.full():
+            self._messages.get_nowait()
+            self.dropped_messages += 1
+        self._messages.put_nowait(message)
+
+    async def progress(self):
+        """Поток сообщений о прогрессе задания"""
+        while True:
+            message = await self._messages.get()
+            if message is None:
+                return
+            yield message
+
+    async def wait(self):
+        """Ожидание завершения; возвращает результаты анализа"""
+        await self._done.wait()
+        if self.status == 'cancelled':
+            raise AnalysisCancelled(f"Задание {self.job_id} отменено")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def _finish(self, status, result=None, error=None):
+        self.status = status
+        self.result = result
+        self.error = error
+        self._post(None)
+        self._done.set()
+
+
+class AnalysisService:
+    """Очередь заданий на анализ с ограниченным числом одновременных запусков.
+
+    В jobs хранятся только незавершённые задания; результаты остаются у
+    объектов AnalysisJob, возвращённых submit.
+    """
+
+    def __init__(self, max_concurrency=None, max_messages=DEFAULT_MAX_MESSAGES):
+        self.max_concurrency = max_concurrency or DEFAULT_MAX_CONCURRENCY
+        self.max_messages = max_messages
+        self.jobs = {}
+        self._queue = asyncio.Queue()
+        self._workers = []
+        self._executor = None
+        self._ids = itertools.count(1)
+
+    async def start(self):
+        if self._workers:
+            return
+        logger.info(f"Запуск сервиса анализа. Параллельных заданий: {self.max_concurrency}")
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+        self._workers = [asyncio.create_task(self._worker())
+                         for _ in range(self.max_concurrency)]
+
+    async def stop(self):
+        logger.info("Остановка сервиса анализа")
+        for job in self.jobs.values():
+            job.cancel()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for job in list(self.jobs.values()):
+            if not job.done:
+                job._finish('cancelled')
+        self.jobs.clear()
+        if self._executor:
+            # Потоки завершаются на следующем сообщении о прогрессе; ждём их,
+            # не блокируя цикл событий
+            executor, self._executor = self._executor, None
+            await asyncio.get_running_loop().run_in_executor(
+                None, functools.partial(executor.shutdown, wait=True))
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+    def submit(self, img_paths, output_pdf, size, **options):
+        """Постановка задания в очередь"""
+        job = AnalysisJob(next(self._ids), img_paths, output_pdf, size, options, self.max_messages)
+        self.jobs[job.job_id] = job
+        self._queue.put_nowait(job)
+        logger.info(f"Задание {job.job_id} поставлено в очередь ({len(job.img_paths)} изображений)")
+        return job
+
+    async def analyze(self, img_paths, output_pdf, size, **options):
+        """Постановка задания в очередь и ожидание результата"""
+        return await self.submit(img_paths, output_pdf, size, **options).wait()
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self.jobs.pop(job.job_id, None)
+                self._queue.task_done()
+
+    async def _run(self, job):
+        # Отменённое в очереди задание уже завершено
+        if job.done:
+            return
+
+        job.status = 'running'
+        try:
+            result = await analyze_images(job.img_paths, job.output_pdf, job.size,
+                                          progress_callback=job._post,
+                                          executor=self._executor,
+                                          cancel_event=job._cancel_event,
+                                          **job.options)
+            job._finish('done', result=result)
+            logger.info(f"Задание {job.job_id} завершено")
+        except AnalysisCancelled:
+            job._finish('cancelled')
+        except asyncio.CancelledError:
+            job._finish('cancelled')
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка задания {job.job_id}: {str(e)}")
+            job._finish('error', error=e)
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# Модули проекта лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# utils при импорте пишет utils.log в текущий каталог - уводим логи тестов из репозитория
+os.chdir(tempfile.mkdtemp(prefix="kursach_tests_"))
@@ -0,0 +1,65 @@
+import threading
+
+import numpy as np
+
+from cache import PairCache, fingerprint_vector, fingerprint_matrix, analysis_key
+
+
+def test_lru_eviction_and_statistics():
+    cache = PairCache(max_entries=2)
+    cache.put('a', 10.0, 0.1)
+    cache.put('b', 20.0, 0.2)
+    assert cache.get('a') == (10.0, 0.1, None)
+
+    # 'b' - самая старая запись после обращения к 'a'
+    cache.put('c', 30.0, None, 'Singular matrix')
+    assert cache.get('b') is None
+
+    stats = cache.statistics()
+    assert stats['entries'] == 2
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['evictions'] == 1
+    assert stats['hit_rate'] == 0.5
+
+
+def test_persistence_keeps_errors(tmp_path):
+    path = str(tmp_path / 'pairs.json')
+    cache = PairCache(path)
+    cache.put('ok', 45.0, 0.5)
+    cache.put('failed', 90.0, None, 'Singular matrix')
+    cache.save()
+
+    loaded = PairCache(path)
+    assert loaded.get('ok') == (45.0, 0.5, None)
+    assert loaded.get('failed') == (90.0, None, 'Singular matrix')
+
+
+def test_concurrent_saves_merge_entries(tmp_path):
+    path = str(tmp_path / 'pairs.json')
+    caches = [PairCache(path) for _ in range(8)]
+    for idx, cache in enumerate(caches):
+        for k in range(20):
+            cache.put(f"{idx}-{k}", float(k), 0.0)
+
+    threads = [threading.Thread(target=cache.save) for cache in caches]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    merged = PairCache(path)
+    assert len(merged.entries) == 8 * 20
+    assert not list(tmp_path.glob('*.tmp')) and not list(tmp_path.glob('*.lock'))
+
+
+def test_keys_depend_on_vectors_and_parameters():
+    v1 = np.array([0, 1, 1, 0])
+    v2 = np.array([1, 1, 1, 0])
+    cov = np.eye(4)
+
+    assert fingerprint_vector(v1) == fingerprint_vector(v1.copy())
+    assert fingerprint_vector(v1) != fingerprint_vector(v2)
+    assert fingerprint_matrix(cov) != fingerprint_matrix(cov.astype(np.float32))
+    assert analysis_key((5, 7), 0.5, cov) != analysis_key((5, 7), 0.6, cov)
+    assert analysis_key((5, 7), 0.5, cov) != analysis_key((7, 5), 0.5, cov)
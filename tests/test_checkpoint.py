@@ -0,0 +1,130 @@
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import checkpoint as checkpoint_module
+import main_logic
+from main_logic import process_images_and_generate_report
+
+
+@pytest.fixture
+def image_paths(tmp_path):
+    rng = np.random.default_rng(2)
+    paths = []
+    for idx in range(9):
+        data = np.where(rng.random((28, 20)) > 0.5, 255, 0).astype(np.uint8)
+        if idx == 4:
+            data[:] = 0
+        path = tmp_path / f"glyph_{idx}.png"
+        Image.fromarray(data, 'L').save(path)
+        paths.append(str(path))
+    # Дубликат глифа
+    Image.open(paths[1]).save(tmp_path / "glyph_copy.png")
+    paths.append(str(tmp_path / "glyph_copy.png"))
+    return paths
+
+
+def _pairs(results):
+    return results['pairwise_analysis']
+
+
+def _crash_after(monkeypatch, pair_count):
+    """Аварийное завершение анализа после pair_count вычисленных углов"""
+    original = main_logic.cosine_angle
+    calls = []
+
+    def failing(v1, v2, dtype=None):
+        calls.append(1)
+        if len(calls) > pair_count:
+            raise KeyboardInterrupt
+        return original(v1, v2, dtype=dtype)
+
+    monkeypatch.setattr(main_logic, 'cosine_angle', failing)
+
+
+def test_resume_matches_uninterrupted_run(image_paths, tmp_path, monkeypatch):
+    expected = process_images_and_generate_report(image_paths, None, (5, 7))
+    checkpoint_path = str(tmp_path / "checkpoint")
+
+    with monkeypatch.context() as patch:
+        _crash_after(patch, 20)
+        with pytest.raises(KeyboardInterrupt):
+            process_images_and_generate_report(image_paths, None, (5, 7), checkpoint_path=checkpoint_path,
+                                               checkpoint_every=2)
+
+    state = checkpoint_module.AnalysisCheckpoint(checkpoint_path, {}).load()
+    assert state is None  # параметры не совпадают
+
+    messages = []
+    resumed = process_images_and_generate_report(image_paths, None, (5, 7), progress_callback=messages.append,
+                                                 checkpoint_path=checkpoint_path, checkpoint_every=2,
+                                                 resume=True)
+
+    assert any("Возобновление" in message for message in messages)
+    assert _pairs(resumed) == _pairs(expected)
+    assert resumed['statistics'] == expected['statistics']
+    assert not os.path.exists(checkpoint_path)
+
+
+def test_changed_image_invalidates_checkpoint(image_paths, tmp_path, monkeypatch):
+    checkpoint_path = str(tmp_path / "checkpoint")
+    with monkeypatch.context() as patch:
+        _crash_after(patch, 20)
+        with pytest.raises(KeyboardInterrupt):
+            process_images_and_generate_report(image_paths, None, (5, 7), checkpoint_path=checkpoint_path,
+                                               checkpoint_every=1)
+
+    data = np.where(np.random.default_rng(3).random((28, 20)) > 0.5, 255, 0).astype(np.uint8)
+    Image.fromarray(data, 'L').save(image_paths[0])
+    expected = process_images_and_generate_report(image_paths, None, (5, 7))
+
+    messages = []
+    resumed = process_images_and_generate_report(image_paths, None, (5, 7), progress_callback=messages.append,
+                                                 checkpoint_path=checkpoint_path, resume=True)
+
+    assert not any("Возобновление" in message for message in messages)
+    assert _pairs(resumed) == _pairs(expected)
+
+
+def test_checkpoint_every_zero_saves_once(image_paths, tmp_path, monkeypatch):
+    saves = []
+    original = checkpoint_module.AnalysisCheckpoint.save
+
+    def counting(self, *args, **kwargs):
+        saves.append(args[3])
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(checkpoint_module.AnalysisCheckpoint, 'save', counting)
+    process_images_and_generate_report(image_paths, None, (5, 7), checkpoint_path=str(tmp_path / "checkpoint"),
+                                       checkpoint_every=0)
+
+    assert saves == [len(image_paths)]
+
+
+def test_save_writes_only_new_blocks(tmp_path):
+    count = 6
+    matrices = np.zeros((count, 7, 5), dtype=int)
+    cov_matrix = np.eye(35)
+    pairs = [{'pair_id': f"{i + 1}-{j + 1}", 'image1_idx': i + 1, 'image2_idx': j + 1,
+              'vector_angle': float(i * 10 + j), 'residual': float(j)}
+             for i in range(count) for j in range(i + 1, count)]
+    pairs[3]['residual'] = None
+    pairs[3]['error'] = "Singular matrix"
+    pairs[7]['duplicate'] = True
+
+    path = str(tmp_path / "checkpoint")
+    saver = checkpoint_module.AnalysisCheckpoint(path, {'size': [5, 7]})
+    saver.save(matrices, cov_matrix, pairs[:5], 1)
+    state_mtime = os.stat(os.path.join(path, 'state.npz')).st_mtime_ns
+
+    # Уже записанные пары не перезаписываются
+    stale = [dict(pair, vector_angle=-1.0) for pair in pairs[:5]] + pairs[5:]
+    saver.save(matrices, cov_matrix, stale[:12], 3)
+
+    assert os.stat(os.path.join(path, 'state.npz')).st_mtime_ns == state_mtime
+    state = checkpoint_module.AnalysisCheckpoint(path, {'size': [5, 7]}).load()
+    assert state['completed_rows'] == 3
+    assert state['pairwise_analysis'] == pairs[:12]
+    assert state['cov_matrix'].tolist() == cov_matrix.tolist()
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from main_logic import process_images_and_generate_report, process_threshold_sweep
+
+
+@pytest.fixture
+def image_paths(tmp_path):
+    rng = np.random.default_rng(1)
+    paths = []
+    for idx in range(6):
+        data = np.where(rng.random((28, 20)) > 0.5, 255, 0).astype(np.uint8)
+        path = tmp_path / f"glyph_{idx}.png"
+        Image.fromarray(data, 'L').save(path)
+        paths.append(str(path))
+    return paths
+
+
+def test_reduced_precision_keeps_exact_angles(image_paths):
+    reference = process_images_and_generate_report(image_paths, None, (5, 7))
+    reduced = process_images_and_generate_report(image_paths, None, (5, 7), compute_dtype=np.float32,
+                                                 verify_precision=True)
+
+    # Углы бинарных векторов считаются в int64 независимо от compute_dtype
+    assert ([pair['vector_angle'] for pair in reduced['pairwise_analysis']]
+            == [pair['vector_angle'] for pair in reference['pairwise_analysis']])
+    assert set(reduced['precision']) == {'compute_dtype', 'cov_max_abs_error', 'residual_max_abs_error'}
+    assert reduced['precision']['compute_dtype'] == 'float32'
+
+
+def _save_glyphs(directory, glyphs):
+    paths = []
+    for idx, data in enumerate(glyphs):
+        path = directory / f"sweep_{idx}.png"
+        Image.fromarray(data.astype(np.uint8), 'L').save(path)
+        paths.append(str(path))
+    return paths
+
+
+def test_threshold_sweep_tolerates_glyphs_blank_everywhere(tmp_path):
+    rng = np.random.default_rng(4)
+    glyphs = [np.where(rng.random((28, 20)) > 0.5, 0, 255) for _ in range(4)]
+    # Пробел пуст при любом пороге, светло-серый символ стирается только низким порогом
+    glyphs.append(np.full((28, 20), 255))
+    faint = np.full((28, 20), 255)
+    faint[5:20, 8:12] = 150
+    glyphs.append(faint)
+    paths = _save_glyphs(tmp_path, glyphs)
+
+    results = process_threshold_sweep(paths, (5, 7), [0.3, 0.5, 0.7])
+    blank = {entry['threshold']: entry['blank_images'] for entry in results['threshold_sweep']}
+
+    assert blank[0.5] == blank[0.7] == 1
+    assert blank[0.3] == 2
+    assert results['best_threshold'] in (0.5, 0.7)
@@ -0,0 +1,45 @@
+import os
+
+import numpy as np
+
+from report import _section_file, _prune_section_cache, _write_section, _save_array
+
+
+def test_section_file_reuses_cached_sections(tmp_path):
+    cache_dir = str(tmp_path / "sections")
+    angles = np.array([10.0, 20.0])
+
+    path, cached = _section_file("histogram", (angles, (5, 7)), ".png", cache_dir, str(tmp_path))
+    assert not cached
+    _write_section(path, lambda target: _save_array(target, angles))
+
+    same, cached = _section_file("histogram", (angles.copy(), (5, 7)), ".png", cache_dir, str(tmp_path))
+    assert (same, cached) == (path, True)
+
+    # Любое изменение входных данных даёт другой файл
+    other, cached = _section_file("histogram", (angles.astype(np.float32), (5, 7)), ".png",
+                                  cache_dir, str(tmp_path))
+    assert other != path and not cached
+    assert not any(name.endswith('.part') for name in os.listdir(cache_dir))
+
+
+def test_section_file_without_cache_uses_temp_dir(tmp_path):
+    path, cached = _section_file("histogram", (), ".png", None, str(tmp_path), "hist_1")
+    assert (path, cached) == (os.path.join(str(tmp_path), "hist_1.png"), False)
+
+
+def test_prune_removes_least_recently_used(tmp_path):
+    cache_dir = tmp_path / "sections"
+    cache_dir.mkdir()
+    for idx in range(5):
+        path = cache_dir / f"section_{idx}.png"
+        path.write_bytes(b"x" * 100)
+        os.utime(path, (1000 + idx, 1000 + idx))
+    # Недописанный файл другого потока не трогаем
+    (cache_dir / "section_9.png.1.part").write_bytes(b"x" * 1000)
+    # Использование отмечает файл как свежий
+    os.utime(cache_dir / "section_0.png", (2000, 2000))
+
+    _prune_section_cache(str(cache_dir), max_bytes=250)
+
+    assert sorted(os.listdir(cache_dir)) == ["section_0.png", "section_4.png", "section_9.png.1.part"]
@@ -0,0 +1,129 @@
+import asyncio
+import json
+import threading
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import main_logic
+from main_logic import process_images_and_generate_report
+from service import AnalysisService, AnalysisCancelled
+
+
+@pytest.fixture
+def image_paths(tmp_path):
+    rng = np.random.default_rng(0)
+    paths = []
+    for idx in range(6):
+        data = np.where(rng.random((28, 20)) > 0.5, 255, 0).astype(np.uint8)
+        path = tmp_path / f"glyph_{idx}.png"
+        Image.fromarray(data, 'L').save(path)
+        paths.append(str(path))
+    return paths
+
+
+async def _serve_http(service, host='127.0.0.1'):
+    """Минимальный локальный HTTP-сервер поверх сервиса: POST /analyze с JSON
+    {"paths": [...], "size": [w, h]} возвращает углы пар"""
+
+    async def handle(reader, writer):
+        request = await reader.readuntil(b"\r\n\r\n")
+        length = 0
+        for line in request.decode().split("\r\n"):
+            if line.lower().startswith("content-length:"):
+                length = int(line.split(":", 1)[1])
+        body = json.loads(await reader.readexactly(length))
+
+        results = await service.analyze(body['paths'], None, tuple(body['size']))
+        payload = json.dumps({'angles': [pair['vector_angle'] for pair in results['pairwise_analysis']]})
+
+        writer.write(f"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n{payload}".encode())
+        await writer.drain()
+        writer.close()
+
+    return await asyncio.start_server(handle, host, 0)
+
+
+async def _post(port, body):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    data = json.dumps(body)
+    writer.write(f"POST /analyze HTTP/1.1\r\nHost: localhost\r\n"
+                 f"Content-Length: {len(data)}\r\n\r\n{data}".encode())
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return json.loads(response.split(b"\r\n\r\n", 1)[1])
+
+
+def test_concurrent_http_requests(image_paths):
+    expected = process_images_and_generate_report(image_paths, None, (5, 7))
+    expected_angles = [pair['vector_angle'] for pair in expected['pairwise_analysis']]
+
+    async def scenario():
+        async with AnalysisService(max_concurrency=2) as service:
+            server = await _serve_http(service)
+            port = server.sockets[0].getsockname()[1]
+            async with server:
+                return await asyncio.gather(*[
+                    _post(port, {'paths': image_paths, 'size': [5, 7]}) for _ in range(5)])
+
+    responses = asyncio.run(scenario())
+
+    assert [response['angles'] for response in responses] == [expected_angles] * 5
+
+
+def test_progress_stream_and_job_cleanup(image_paths):
+    async def scenario():
+        async with AnalysisService(max_concurrency=1) as service:
+            job = service.submit(image_paths, None, (5, 7))
+            messages = [message async for message in job.progress()]
+            await job.wait()
+            return job, messages, dict(service.jobs)
+
+    job, messages, jobs = asyncio.run(scenario())
+
+    assert job.status == 'done'
+    assert any(message.startswith("Пара 1-2") for message in messages)
+    assert jobs == {}
+
+
+def test_cancel_queued_job_finishes_immediately(image_paths, monkeypatch):
+    release = threading.Event()
+    original = main_logic.covariance_matrix
+
+    def blocking_covariance(vectors, dtype=float):
+        release.wait(timeout=10)
+        return original(vectors, dtype=dtype)
+
+    monkeypatch.setattr(main_logic, 'covariance_matrix', blocking_covariance)
+
+    async def scenario():
+        async with AnalysisService(max_concurrency=1) as service:
+            running = service.submit(image_paths, None, (5, 7))
+            queued = service.submit(image_paths, None, (5, 7))
+            await asyncio.sleep(0.05)
+
+            queued.cancel()
+            with pytest.raises(AnalysisCancelled):
+                await asyncio.wait_for(queued.wait(), timeout=1)
+            assert [message async for message in queued.progress()] == []
+            assert running.status == 'running'
+
+            # Отмена выполняемого задания срабатывает сразу после ковариации
+            running.cancel()
+            release.set()
+            with pytest.raises(AnalysisCancelled):
+                await asyncio.wait_for(running.wait(), timeout=5)
+            return queued.status, running.status
+
+    assert asyncio.run(scenario()) == ('cancelled', 'cancelled')
+
+
+def test_cancel_event_stops_pair_loop_without_callbacks(image_paths):
+    cancel_event = threading.Event()
+    cancel_event.set()
+
+    with pytest.raises(AnalysisCancelled):
+        process_images_and_generate_report(image_paths, None, (5, 7), cancel_event=cancel_event)
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from utils import (
+    load_image_as_matrix_and_vector,
+    load_images_as_matrices_and_vectors,
+    cosine_angle,
+    gram_angles,
+)
+
+
+def _save_random_images(directory, shapes, seed=0):
+    """Случайные изображения заданных размеров (высота, ширина) в разных режимах"""
+    rng = np.random.default_rng(seed)
+    paths = []
+    for idx, (rows, cols) in enumerate(shapes):
+        data = rng.integers(0, 256, (rows, cols), dtype=np.uint8)
+        if idx % 2:
+            # Контрастные изображения, похожие на символы
+            data = np.where(data > 128, 255, 0).astype(np.uint8)
+        img = Image.fromarray(data, 'L')
+        if idx % 3 == 0:
+            img = img.convert('RGB')
+        path = directory / f"img_{idx}.png"
+        img.save(path)
+        paths.append(str(path))
+    return paths
+
+
+@pytest.mark.parametrize("shapes, size", [
+    # Уменьшение
+    ([(64, 48)] * 4, (5, 7)),
+    # Увеличение
+    ([(3, 2)] * 4, (10, 14)),
+    # Результат меньше 3 пикселей: фильтр резкости не применяется
+    ([(20, 30)] * 3, (2, 2)),
+    ([(20, 30)] * 3, (1, 5)),
+    # Исходные изображения меньше 3 пикселей
+    ([(1, 2), (2, 1), (2, 2)], (6, 4)),
+    # Разные исходные размеры в одном пакете, совпадающий размер по одной оси
+    ([(64, 48), (30, 20), (7, 5), (7, 33), (1, 1)], (5, 7)),
+    ([(64, 48), (30, 20), (14, 10)], (10, 14)),
+])
+def test_batched_loading_matches_pil(tmp_path, shapes, size):
+    paths = _save_random_images(tmp_path, shapes)
+
+    matrices, vectors = load_images_as_matrices_and_vectors(paths, size)
+
+    assert matrices.shape == (len(paths), size[1], size[0])
+    for idx, path in enumerate(paths):
+        matrix, vector = load_image_as_matrix_and_vector(path, size)
+        np.testing.assert_array_equal(matrices[idx], matrix)
+        np.testing.assert_array_equal(vectors[idx], vector)
+
+
+@pytest.mark.parametrize("threshold", [0.2, 0.5, 0.8])
+def test_batched_loading_matches_pil_thresholds(tmp_path, threshold):
+    paths = _save_random_images(tmp_path, [(40, 30)] * 3, seed=1)
+
+    _, vectors = load_images_as_matrices_and_vectors(paths, (5, 7), threshold)
+
+    for idx, path in enumerate(paths):
+        _, vector = load_image_as_matrix_and_vector(path, (5, 7), threshold)
+        np.testing.assert_array_equal(vectors[idx], vector)
+
+
+def test_gram_angles_match_cosine_angle():
+    rng = np.random.default_rng(2)
+    vectors = rng.integers(0, 2, (6, 35))
+    vectors[0] = 0
+    vectors[1] = vectors[2]
+
+    angles = gram_angles((vectors @ vectors.T).astype(np.float64))
+
+    for i in range(len(vectors)):
+        for j in range(len(vectors)):
+            if i != j:
+                assert angles[i, j] == cosine_angle(vectors[i], vectors[j])
+    assert angles[0, 3] == 90.0
@@ -33,16 +33,153 @@ def load_image_as_matrix_and_vector(path, size, threshold=0.5):
         logger.critical(f"Ошибка загрузки {path}: {e}")
         raise
 
-def cosine_angle(v1, v2):
-    """Вычисление угла между векторами"""
+# Точность фиксированной запятой, которую PIL использует при ресемплинге 8-битных изображений
+_RESAMPLE_PRECISION_BITS = 32 - 8 - 2
+
+
+def _bicubic_filter(x):
+    """Бикубическое ядро PIL (a = -0.5)"""
+    a = -0.5
+    x = np.abs(x)
+    return np.where(x < 1.0, ((a + 2.0) * x - (a + 3.0)) * x * x + 1.0,
+                    np.where(x < 2.0, (((x - 5.0) * x + 8.0) * x - 4.0) * a, 0.0))
+
+
+def _resample_coeffs(in_size, out_size):
+    """Матрица целочисленных весов бикубического ресемплинга (как в PIL)"""
+    scale = in_size / out_size
+    filterscale = max(scale, 1.0)
+    support = 2.0 * filterscale
+
+    coeffs = np.zeros((out_size, in_size), dtype=np.int64)
+    for xx in range(out_size):
+        center = (xx + 0.5) * scale
+        xmin = max(int(center - support + 0.5), 0)
+        xmax = min(int(center + support + 0.5), in_size)
+
+        k = _bicubic_filter((np.arange(xmin, xmax) - center + 0.5) / filterscale)
+        total = k.sum()
+        if total != 0:
+            k = k / total
+
+        k = k * (1 << _RESAMPLE_PRECISION_BITS)
+        coeffs[xx, xmin:xmax] = np.where(k < 0, np.trunc(k - 0.5), np.trunc(k + 0.5))
+    return coeffs
+
+
+def _resample_axis(stack, out_size, axis):
+    """Ресемплинг стека изображений вдоль одной оси"""
+    coeffs = _resample_coeffs(stack.shape[axis], out_size)
+    data = np.moveaxis(stack, axis, -1).astype(np.int64) @ coeffs.T
+    data = (data + (1 << (_RESAMPLE_PRECISION_BITS - 1))) >> _RESAMPLE_PRECISION_BITS
+    return np.moveaxis(np.clip(data, 0, 255).astype(np.uint8), -1, axis)
+
+
+def _sharpen_stack(stack):
+    """Фильтр ImageFilter.SHARPEN для стека изображений (крайние пиксели не меняются)"""
+    result = stack.copy()
+    n, rows, cols = stack.shape
+    if rows < 3 or cols < 3:
+        return result
+
+    data = stack.astype(np.int64)
+    center = data[:, 1:-1, 1:-1]
+    window = np.zeros_like(center)
+    for dy in range(3):
+        for dx in range(3):
+            window += data[:, dy:dy + rows - 2, dx:dx + cols - 2]
+
+    # Ядро (-2 ... 32 ... -2) / 16 с округлением к ближайшему
+    value = 34 * center - 2 * window
+    result[:, 1:-1, 1:-1] = np.clip((value + 8) // 16, 0, 255)
+    return result
+
+
+def decode_images(paths):
+    """Декодирование изображений в оттенки серого.
+
+    Возвращает группы (индексы, стек) изображений одного исходного размера;
+    стек хранится транспонированным (n, W, H).
+    """
+    logger.info(f"Декодирование изображений: {len(paths)}")
+    try:
+        groups = {}
+        for idx, path in enumerate(paths):
+            with Image.open(path) as img:
+                gray = np.array(img.convert('L'))
+            groups.setdefault(gray.shape, []).append((idx, gray))
+
+        return [([idx for idx, _ in items], np.stack([gray.T for _, gray in items]))
+                for items in groups.values()]
+
+    except Exception as e:
+        logger.critical(f"Ошибка декодирования изображений: {e}")
+        raise
+
+
+def sharpen_images(grayscale, size):
+    """Ресемплинг и повышение резкости декодированных изображений (см. decode_images).
+
+    Стек (N, W, H) хранится транспонированным: тогда векторизация
+    по столбцам - это просто reshape без копирования.
+    """
+    width, height = size
+    count = sum(len(indices) for indices, _ in grayscale)
+
+    stack = np.empty((count, width, height), dtype=np.uint8)
+    for indices, group in grayscale:
+        if group.shape[1] != width:
+            group = _resample_axis(group, width, axis=1)
+        if group.shape[2] != height:
+            group = _resample_axis(group, height, axis=2)
+        stack[indices] = _sharpen_stack(group)
+    return stack
+
+
+def preprocess_images(grayscale, size, threshold=0.5):
+    """Обработка декодированных изображений (см. decode_images): матрицы и векторы"""
+    stack = sharpen_images(grayscale, size)
+    count = len(stack)
+
+    binary = (stack / 255.0 < threshold).astype(int)
+    matrices = binary.transpose(0, 2, 1)
+    vectors = binary.reshape(count, -1)
+
+    logger.info(f"Изображения обработаны. Размер: {matrices.shape}")
+    return matrices, vectors
+
+
+def load_images_as_matrices_and_vectors(paths, size, threshold=0.5):
+    """Пакетная загрузка и обработка изображений.
+
+    Результат совпадает с load_image_as_matrix_and_vector для каждого
+    изображения: матрицы (N, H, W) и векторы (N, H*W) в порядке 'F'.
+    """
+    logger.info(f"Пакетная загрузка изображений: {len(paths)}")
+    try:
+        return preprocess_images(decode_images(paths), size, threshold)
+
+    except Exception as e:
+        logger.critical(f"Ошибка пакетной загрузки: {e}")
+        raise
+
+def cosine_angle(v1, v2, dtype=None):
+    """Вычисление угла между векторами.
+
+    По умолчанию целочисленные (бинарные) векторы перемножаются точно в int64,
+    остальные - в float64.
+    """
     logger.debug("Вычисление угла между векторами")
     try:
-        v1 = v1.flatten().astype(float)
-        v2 = v2.flatten().astype(float)
+        if dtype is None:
+            integer = np.issubdtype(v1.dtype, np.integer) and np.issubdtype(v2.dtype, np.integer)
+            dtype = np.int64 if integer else float
+        v1 = v1.flatten().astype(dtype)
+        v2 = v2.flatten().astype(dtype)
 
         dot_product = np.dot(v1, v2)
-        norm1 = np.linalg.norm(v1)
-        norm2 = np.linalg.norm(v2)
+        norm1 = np.sqrt(np.dot(v1, v1))
+        norm2 = np.sqrt(np.dot(v2, v2))
 
         if norm1 == 0 or norm2 == 0:
             return 90.0
@@ -58,31 +195,54 @@ def cosine_angle(v1, v2):
         logger.error(f"Ошибка вычисления угла: {str(e)}")
         raise
 
-def covariance_matrix(vectors):
-    """Вычисление ковариационной матрицы"""
+def gram_angles(gram):
+    """Матрица углов между всеми парами векторов по их матрице Грама.
+
+    Для бинарных векторов совпадает с cosine_angle для каждой пары.
+    """
+    logger.debug("Вычисление углов через матрицу Грама")
+    try:
+        norms = np.sqrt(np.diag(gram))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cos_theta = gram / (norms[:, None] * norms[None, :])
+        angles = np.degrees(np.arccos(np.clip(cos_theta, -1.0, 1.0)))
+
+        # Нулевые векторы, как и в cosine_angle
+        zero = norms == 0
+        angles[zero, :] = 90.0
+        angles[:, zero] = 90.0
+        return angles
+
+    except Exception as e:
+        logger.error(f"Ошибка вычисления углов по матрице Грама: {str(e)}")
+        raise
+
+def covariance_matrix(vectors, dtype=float):
+    """Вычисление ковариационной матрицы (dtype - точность вычислений)"""
     logger.info("Вычисление ковариационной матрицы")
     try:
         stacked = np.stack([v.flatten() for v in vectors])
-        cov = np.cov(stacked, rowvar=False)
-        logger.info(f"Ковариационная матрица: {cov.shape}")
+        cov = np.cov(stacked, rowvar=False, dtype=dtype)
+        logger.info(f"Ковариационная матрица: {cov.shape}, {cov.dtype}")
         return cov
     except Exception as e:
         logger.error(f"Ошибка вычисления ковариации: {e}")
         raise
 
-def apply_least_squares(A, b, cov_matrix=None):
-    """Обобщённый метод наименьших квадратов"""
+def apply_least_squares(A, b, cov_matrix=None, dtype=float):
+    """Обобщённый метод наименьших квадратов (dtype - точность вычислений)"""
     logger.debug("Применение МНК")
     try:
-        A = A.astype(float)
-        b = b.astype(float).flatten()
+        A = A.astype(dtype)
+        b = b.astype(dtype).flatten()
 
         if cov_matrix is None:
             # Стандартный МНК
             x = np.linalg.lstsq(A, b, rcond=None)[0]
         else:
             # Обобщённый МНК с ковариацией
-            cov_matrix = cov_matrix.astype(float)
+            cov_matrix = cov_matrix.astype(dtype)
             try:
                 cov_inv = np.linalg.inv(cov_matrix)
             except: